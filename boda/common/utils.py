@@ -527,12 +527,37 @@ def unpack_artifact(artifact_path,download_path='./'):
     shutil.unpack_archive(tar_model, download_path)
     print(f'archive unpacked in {download_path}', file=sys.stderr)
 
-def model_fn(model_dir):
+def swap_dropout_for_identity(module):
+    """
+    Replace nn.Dropout submodules with nn.Identity, in-place.
+
+    Dropout is a no-op in eval mode but still dispatches the op and checks
+    the training flag on every call; swapping it out removes it from
+    inference graphs entirely. Dropout holds no parameters, so this is safe
+    after load_state_dict.
+
+    Args:
+        module (nn.Module): Module to modify in-place.
+
+    Returns:
+        torch.nn.Module: The modified module.
+    """
+    for name, child in module.named_children():
+        if isinstance(child, nn.Dropout):
+            setattr(module, name, nn.Identity())
+        else:
+            swap_dropout_for_identity(child)
+    return module
+
+def model_fn(model_dir, script=False):
     """
     Load a model from a directory.
 
     Args:
         model_dir (str): Path to the model directory.
+        script (bool, optional): Compile the model with TorchScript for
+            inference, removing per-call Python dispatch. Falls back to
+            tracing, then to the eager module, if scripting fails. Defaults to False.
 
     Returns:
         torch.nn.Module: Loaded model in evaluation mode.
@@ -543,6 +568,16 @@ def model_fn(model_dir):
     model.load_state_dict(checkpoint['model_state_dict'])
     print(f'Loaded model from {checkpoint["timestamp"]} in eval mode')
     model.eval()
+    swap_dropout_for_identity(model)
+    if script:
+        try:
+            model = torch.jit.freeze(torch.jit.script(model))
+        except Exception:
+            try:
+                example = torch.rand(1, model.numFeatures, model.seqLen)
+                model = torch.jit.freeze(torch.jit.trace(model, example))
+            except Exception:
+                print('TorchScript compilation failed, using eager model', file=sys.stderr)
     return model
 
 def load_model(artifact_path):
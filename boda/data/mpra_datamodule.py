@@ -1,3 +1,4 @@
+import os
 import sys
 import argparse
 import tempfile
@@ -109,7 +110,11 @@ class MPRA_DataModule(pl.LightningDataModule):
         synth_seed (int, optional): Seed for synthetic data selection. Default is 0.
         batch_size (int, optional): Number of examples in each mini batch. Default is 32.
         padded_seq_len (int, optional): Desired total sequence length after padding. Default is 600.
-        num_workers (int, optional): Number of workers for data loading. Default is 8.
+        num_workers (int, optional): Number of workers for data loading. Default is None,
+            which auto-detects from the cpu core and visible GPU counts, clamped to [2, 8].
+        pin_memory (bool, optional): Stage batches in pinned host memory for faster H2D copies. Default is True.
+        persistent_workers (bool, optional): Keep DataLoader workers alive between epochs. Default is True.
+        prefetch_factor (int, optional): Batches prefetched per DataLoader worker. Default is 4.
         normalize (bool, optional): Apply standard score normalization. Default is False.
         duplication_cutoff (float, optional): Cutoff value for duplicating sequences during training. Default is None.
         use_reverse_complements (bool, optional): Whether to use reverse complements for data augmentation. Default is False.
@@ -156,8 +161,14 @@ class MPRA_DataModule(pl.LightningDataModule):
                            help='Desired total sequence length after padding')
         group.add_argument('--left_flank', type=str, default=constants.MPRA_UPSTREAM, help="Flanking sequence to provide upstream padding for sequences.")
         group.add_argument('--right_flank', type=str, default=constants.MPRA_DOWNSTREAM, help="Flanking sequence to provide upstream padding for sequences.")
-        group.add_argument('--num_workers', type=int, default=8, 
-                           help='number of gpus or cpu cores to be used') 
+        group.add_argument('--num_workers', type=int, default=None,
+                           help='number of DataLoader worker processes; auto-detected from cpu/gpu counts if unset')
+        group.add_argument('--pin_memory', type=utils.str2bool, default=True,
+                           help='stage batches in pinned host memory for faster H2D copies')
+        group.add_argument('--persistent_workers', type=utils.str2bool, default=True,
+                           help='keep DataLoader workers alive between epochs')
+        group.add_argument('--prefetch_factor', type=int, default=4,
+                           help='batches prefetched per DataLoader worker')
         group.add_argument('--normalize', type=utils.str2bool, default=False, 
                            help='apply standard score normalization')
         group.add_argument('--duplication_cutoff', type=float, 
@@ -199,7 +210,10 @@ class MPRA_DataModule(pl.LightningDataModule):
                  padded_seq_len=600, 
                  left_flank=constants.MPRA_UPSTREAM,
                  right_flank=constants.MPRA_DOWNSTREAM,
-                 num_workers=8,
+                 num_workers=None,
+                 pin_memory=True,
+                 persistent_workers=True,
+                 prefetch_factor=4,
                  normalize=False,
                  duplication_cutoff=None,
                  use_reverse_complements=False,
@@ -230,7 +244,12 @@ class MPRA_DataModule(pl.LightningDataModule):
         self.padded_seq_len = padded_seq_len  
         self.left_flank = left_flank
         self.right_flank = right_flank
+        if num_workers is None:
+            num_workers = max(2, min(8, (os.cpu_count() or 2) // max(1, torch.cuda.device_count() or 1)))
         self.num_workers = num_workers
+        self.pin_memory = pin_memory
+        self.persistent_workers = persistent_workers
+        self.prefetch_factor = prefetch_factor
         self.normalize = normalize
         self.duplication_cutoff = duplication_cutoff
         self.use_reverse_complements = use_reverse_complements
@@ -415,65 +434,71 @@ class MPRA_DataModule(pl.LightningDataModule):
         print(f'Excluded from train: {excluded_size} ({excluded_pct})%')
         print('-'*50)    
                 
+    @property
+    def loader_kwargs(self):
+        """
+        Shared DataLoader options, built per call so attribute updates
+        (e.g. Lightning's batch-size tuner setting batch_size) take effect.
+        """
+        kwargs = {'batch_size': self.batch_size,
+                  'num_workers': self.num_workers,
+                  'pin_memory': self.pin_memory}
+        #worker-only options; DataLoader rejects them when num_workers == 0
+        if self.num_workers > 0:
+            kwargs.update({'persistent_workers': self.persistent_workers,
+                           'prefetch_factor': self.prefetch_factor})
+        return kwargs
+
     def train_dataloader(self):
         """
         Returns a DataLoader for the training dataset.
         """
-        return DataLoader(self.dataset_train, batch_size=self.batch_size,
-                          shuffle=True, num_workers=self.num_workers)
+        return DataLoader(self.dataset_train, shuffle=True, **self.loader_kwargs)
     
     def val_dataloader(self):
         """
         Returns a DataLoader for the validation dataset.
         """
-        return DataLoader(self.dataset_val, batch_size=self.batch_size,
-                          shuffle=False, num_workers=self.num_workers)
+        return DataLoader(self.dataset_val, shuffle=False, **self.loader_kwargs)
 
     def test_dataloader(self):
         """
         Returns a DataLoader for the test dataset.
         """
-        return DataLoader(self.dataset_test, batch_size=self.batch_size,
-                          shuffle=False, num_workers=self.num_workers)
+        return DataLoader(self.dataset_test, shuffle=False, **self.loader_kwargs)
     
     def synth_train_dataloader(self):
         """
         Returns a DataLoader for the synthetic training dataset.
         """
-        return DataLoader(self.synth_dataset_train, batch_size=self.batch_size,
-                          shuffle=True, num_workers=self.num_workers)
+        return DataLoader(self.synth_dataset_train, shuffle=True, **self.loader_kwargs)
     
     def synth_val_dataloader(self):
         """
         Returns a DataLoader for the synthetic validation dataset.
         """
-        return DataLoader(self.synth_dataset_val, batch_size=self.batch_size,
-                          shuffle=False, num_workers=self.num_workers)
+        return DataLoader(self.synth_dataset_val, shuffle=False, **self.loader_kwargs)
 
     def synth_test_dataloader(self):
         """
         Returns a DataLoader for the synthetic test dataset.
         """
-        return DataLoader(self.synth_dataset_test, batch_size=self.batch_size,
-                          shuffle=False, num_workers=self.num_workers)
+        return DataLoader(self.synth_dataset_test, shuffle=False, **self.loader_kwargs)
     
     def chr_train_dataloader(self):
         """
         Returns a DataLoader for the chromosome-based training dataset.
         """
-        return DataLoader(self.chr_dataset_train, batch_size=self.batch_size,
-                          shuffle=True, num_workers=self.num_workers)
+        return DataLoader(self.chr_dataset_train, shuffle=True, **self.loader_kwargs)
     
     def chr_val_dataloader(self):
         """
         Returns a DataLoader for the chromosome-based validation dataset.
         """
-        return DataLoader(self.chr_dataset_val, batch_size=self.batch_size,
-                          shuffle=False, num_workers=self.num_workers)
+        return DataLoader(self.chr_dataset_val, shuffle=False, **self.loader_kwargs)
 
     def chr_test_dataloader(self):
         """
         Returns a DataLoader for the chromosome-based test dataset.
         """
-        return DataLoader(self.chr_dataset_test, batch_size=self.batch_size,
-                          shuffle=False, num_workers=self.num_workers)
\ No newline at end of file
+        return DataLoader(self.chr_dataset_test, shuffle=False, **self.loader_kwargs)
\ No newline at end of file
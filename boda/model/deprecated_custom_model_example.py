@@ -1,8 +1,8 @@
 import argparse
+import functools
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torchsummary import summary
 import lightning.pytorch as pl
 
 '''
@@ -12,8 +12,15 @@ class MPRAregressionModel(pl.LightningModule):
 
     @staticmethod
     def add_model_specific_args(parent_parser):
+        #lazy import so running this file directly (the __main__ demo) still
+        #works without a parent package
+        try:
+            from ..common.utils import str2bool
+        except ImportError:
+            from boda.common.utils import str2bool
+
         parser = argparse.ArgumentParser(parents=[parent_parser], add_help=False)
-        
+
         #training params
         parser.add_argument('--LR', type=float, default=0.0005)
         parser.add_argument('--momentum', type=float, default=0.9)
@@ -21,11 +28,14 @@ class MPRAregressionModel(pl.LightningModule):
         parser.add_argument('--dropout', type=float, default=0.2)
         parser.add_argument('--optimizer', type=str, default='Adam')
         parser.add_argument('--scheduler', type=bool, default=True)
+        parser.add_argument('--useAMP', type=str2bool, default=True)
+        parser.add_argument('--activation', type=str, choices=['tanh', 'relu', 'gelu'], default='relu')
         
         #input shape
         parser.add_argument('--seqLen', type=int, default=600)
         parser.add_argument('--numFeatures', type=int, default=4)
         parser.add_argument('--targetLen', type=int, default=1)
+        parser.add_argument('--storeExampleInput', type=str2bool, default=False)
         
         #network params
         parser.add_argument('--numChannels1', type=int, default=20)
@@ -48,9 +58,12 @@ class MPRAregressionModel(pl.LightningModule):
         
         parser.add_argument('--linearLayerLen1', type=int, default=50)
         parser.add_argument('--linearLayerLen2', type=int, default=10)
+
+        parser.add_argument('--padChannels', type=str2bool, default=True)
+        parser.add_argument('--compileLayers', type=str2bool, default=False)
+        parser.add_argument('--useCudaGraphs', type=str2bool, default=False)
+        parser.add_argument('--firstConvDepthwise', type=str2bool, default=False)
         
-        args = parser.parse_args()
-        print(f'Parser argumentss: {vars(args)}')
         return parser
     
     def __init__(self,
@@ -60,9 +73,12 @@ class MPRAregressionModel(pl.LightningModule):
                  dropout=0.2,
                  optimizer='Adam',
                  scheduler=True,
+                 useAMP=True,
+                 activation='relu',
                  seqLen=600,
                  numFeatures=4,
                  targetLen=1,
+                 storeExampleInput=False,
                  numChannels1=20,
                  kernelSize1=6,
                  stride1=3,
@@ -78,7 +94,11 @@ class MPRAregressionModel(pl.LightningModule):
                  poolKernel2=2,
                  poolStride2=2,
                  linearLayerLen1=50,
-                 linearLayerLen2=10, **kwargs):
+                 linearLayerLen2=10,
+                 padChannels=True,
+                 compileLayers=False,
+                 useCudaGraphs=False,
+                 firstConvDepthwise=False, **kwargs):
         
         super().__init__()
         #training params
@@ -88,13 +108,22 @@ class MPRAregressionModel(pl.LightningModule):
         self.dropout = dropout       
         self.optimizer = optimizer
         self.scheduler = scheduler
+        self.useAMP = useAMP
         self.loss = nn.MSELoss()
+        #ReLU fuses into the cuDNN conv epilogue (tanh cannot) and inplace
+        #drops the separate activation output buffer
+        self.activation = activation
+        makeActivation = {'tanh': nn.Tanh,
+                          'relu': lambda: nn.ReLU(inplace=True),
+                          'gelu': nn.GELU}[self.activation]
         
         #input shape
         self.seqLen = seqLen
         self.numFeatures = numFeatures
         self.targetLen = targetLen
-        self.example_input_array = torch.rand(1, self.numFeatures, self.seqLen)
+        #only allocated on request; the tensor otherwise rides along on .to(device)
+        if storeExampleInput:
+            self.example_input_array = torch.rand(1, self.numFeatures, self.seqLen)
         
         #network params
         self.numChannels1 = numChannels1
@@ -133,35 +162,115 @@ class MPRAregressionModel(pl.LightningModule):
         
         self.linearLayerLen1 = linearLayerLen1
         self.linearLayerLen2 = linearLayerLen2
-        
+
+        #tensor-core GEMM/conv kernels need channel dims divisible by 8
+        self.padChannels = padChannels
+        if self.padChannels:
+            self.numFeatures_padded = self.padToMultiple(self.numFeatures, 8)
+            self.numChannels1_padded = self.padToMultiple(self.numChannels1, 8)
+            self.numChannels2_padded = self.padToMultiple(self.numChannels2, 8)
+            self.linearLayerLen1_padded = self.padToMultiple(self.linearLayerLen1, 8)
+            self.linearLayerLen2_padded = self.padToMultiple(self.linearLayerLen2, 8)
+        else:
+            self.numFeatures_padded = self.numFeatures
+            self.numChannels1_padded = self.numChannels1
+            self.numChannels2_padded = self.numChannels2
+            self.linearLayerLen1_padded = self.linearLayerLen1
+            self.linearLayerLen2_padded = self.linearLayerLen2
+
         #hidden layers
+        #Conv2d with (1,k) kernels is equivalent to Conv1d but supports the
+        #channels_last (NHWC) layout cuDNN tensor-core kernels want natively,
+        #avoiding the implicit transpose kernels inserted around NCW convs
+        self.firstConvDepthwise = firstConvDepthwise
+        if self.firstConvDepthwise:
+            #depthwise k-tap filter then pointwise 1x1 channel mix; the stride
+            #stays on the depthwise tap so the conv1D_OutDim lengths still hold
+            firstConv = nn.Sequential(
+                nn.Conv2d(in_channels=self.numFeatures_padded, out_channels=self.numFeatures_padded,
+                          kernel_size=(1, self.kernelSize1), stride=(1, self.stride1),
+                          padding=(0, self.padding1), dilation=(1, self.dilation1),
+                          groups=self.numFeatures_padded),
+                nn.Conv2d(in_channels=self.numFeatures_padded, out_channels=self.numChannels1_padded,
+                          kernel_size=(1, 1)) )
+        else:
+            firstConv = nn.Conv2d(in_channels=self.numFeatures_padded, out_channels=self.numChannels1_padded,
+                          kernel_size=(1, self.kernelSize1), stride=(1, self.stride1),
+                          padding=(0, self.padding1), dilation=(1, self.dilation1))
         self.convLayers = nn.Sequential(
-                nn.Conv1d(in_channels=self.numFeatures, out_channels=self.numChannels1,
-                          kernel_size=self.kernelSize1, stride=self.stride1,
-                          padding=self.padding1, dilation=self.dilation1),
-                torch.nn.Tanh(),
-                torch.nn.MaxPool1d(kernel_size=self.poolKernel1, stride=self.poolStride1),
-                nn.Conv1d(in_channels=self.numChannels1, out_channels=self.numChannels2,
-                          kernel_size=self.kernelSize2, stride=self.stride2,
-                          padding=self.padding2, dilation=self.dilation2),
-                torch.nn.Tanh(),
-                torch.nn.MaxPool1d(kernel_size=self.poolKernel2, stride=self.poolStride2) )
-        
+                firstConv,
+                makeActivation(),
+                torch.nn.MaxPool2d(kernel_size=(1, self.poolKernel1), stride=(1, self.poolStride1)),
+                nn.Conv2d(in_channels=self.numChannels1_padded, out_channels=self.numChannels2_padded,
+                          kernel_size=(1, self.kernelSize2), stride=(1, self.stride2),
+                          padding=(0, self.padding2), dilation=(1, self.dilation2)),
+                makeActivation(),
+                torch.nn.MaxPool2d(kernel_size=(1, self.poolKernel2), stride=(1, self.poolStride2)) )
+        self.convLayers = self.convLayers.to(memory_format=torch.channels_last)
+
         self.linearLayers = nn.Sequential(
+                nn.Flatten(start_dim=1),
                 nn.Dropout(p=self.dropout),
-                nn.Linear(self.poolLayerLen2 * self.numChannels2, self.linearLayerLen1),
-                nn.Tanh(),
+                nn.Linear(self.poolLayerLen2 * self.numChannels2_padded, self.linearLayerLen1_padded),
+                makeActivation(),
                 nn.Dropout(p=self.dropout),
-                nn.Linear(self.linearLayerLen1, self.linearLayerLen2),
-                nn.Tanh(),
+                nn.Linear(self.linearLayerLen1_padded, self.linearLayerLen2_padded),
+                makeActivation(),
                 nn.Dropout(p=0.5*self.dropout),
-                nn.Linear(self.linearLayerLen2, self.targetLen) )
+                nn.Linear(self.linearLayerLen2_padded, self.targetLen) )
+
+        #fuse the pointwise Tanh into neighboring conv/pool kernels and cut
+        #launch overhead; 'reduce-overhead' targets the small-batch regime
+        self.compileLayers = compileLayers
+        if self.compileLayers and hasattr(torch, 'compile'):
+            self.convLayers = torch.compile(self.convLayers, mode='reduce-overhead')
+            self.linearLayers = torch.compile(self.linearLayers, mode='reduce-overhead')
+
+        #CUDA graph state for convForwardGraphed
+        self.useCudaGraphs = useCudaGraphs
+        self._convGraph = None
+        self._convGraphInput = None
+        self._convGraphOutput = None
  
     def forward(self, x):
-        convOutput = self.convLayers(x)
-        linearInput = torch.flatten(convOutput, start_dim=1) 
-        y_hat = self.linearLayers(linearInput)
-        return y_hat
+        if x.shape[1] < self.numFeatures_padded:
+            x = F.pad(x, (0, 0, 0, self.numFeatures_padded - x.shape[1]))
+        #(N,C,L) -> (N,C,1,L) in NHWC order for the (1,k) Conv2d stack
+        x = x.unsqueeze(2).to(memory_format=torch.channels_last)
+        #BF16 autocast shares the FP32 exponent range, so no GradScaler is needed
+        useGraph = (self.useCudaGraphs and x.is_cuda
+                    and not self.training and not torch.is_grad_enabled())
+        #the autocast cast-cache must stay off around graph capture: cached
+        #bf16 weight casts are freed when the autocast context exits, so a
+        #graph captured against them would replay reads of freed storage
+        #(cf. torch.cuda.make_graphed_callables asserting cache_enabled=False)
+        with torch.autocast(device_type='cuda', dtype=torch.bfloat16,
+                            enabled=self.useAMP and x.is_cuda,
+                            cache_enabled=not useGraph):
+            if useGraph:
+                convOutput = self.convForwardGraphed(x)
+            else:
+                convOutput = self.convLayers(x)
+            y_hat = self.linearLayers(convOutput)
+        return y_hat.float()
+
+    #replay the conv stack through a captured CUDA graph, replacing its six
+    #per-op kernel launches with one; recaptures if the batch shape changes
+    def convForwardGraphed(self, x):
+        if self._convGraph is None or self._convGraphInput.shape != x.shape:
+            self._convGraphInput = x.clone()
+            warmup_stream = torch.cuda.Stream()
+            warmup_stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(warmup_stream):
+                for _ in range(3):
+                    self.convLayers(self._convGraphInput)
+            torch.cuda.current_stream().wait_stream(warmup_stream)
+            self._convGraph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(self._convGraph):
+                self._convGraphOutput = self.convLayers(self._convGraphInput)
+        self._convGraphInput.copy_(x)
+        self._convGraph.replay()
+        return self._convGraphOutput
     
     def training_step(self, batch, batch_idx):
         x, y = batch
@@ -204,16 +313,24 @@ class MPRAregressionModel(pl.LightningModule):
             return optimizer
     
     
-    #calculate the output length of a 1D-convolutional layer    
+    #calculate the output length of a 1D-convolutional layer
+    #memoized: construction re-queries the same shapes (e.g. model_fn cold-start)
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def conv1D_OutDim(L_in, kernel_size, stride, padding=0, dilation=1):
-        return (L_in + 2*padding - dilation*(kernel_size - 1) - 1)//stride + 1     
+        return (L_in + 2*padding - dilation*(kernel_size - 1) - 1)//stride + 1
+
+    #round a channel count up to the next multiple (tensor-core alignment)
+    @staticmethod
+    def padToMultiple(n, multiple):
+        return ((n + multiple - 1) // multiple) * multiple
     
   
     
 #------------------------------- EXAMPLE --------------------------------------------------
-if __name__ == '__main__':   
-    
+if __name__ == '__main__':
+    from torchsummary import summary
+
     #OPTION 1: use add_model_specific_args to pass arguments:
     parser = argparse.ArgumentParser(description="MPRAmodel", add_help=False)
     parser = MPRAregressionModel.add_model_specific_args(parser) 
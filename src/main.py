@@ -1,3 +1,4 @@
+import io
 import os
 import sys
 import re
@@ -7,7 +8,7 @@ import shutil
 import argparse
 import tarfile
 import tempfile
-import random
+import uuid
 import subprocess
 
 import torch
@@ -56,7 +57,8 @@ def set_best(my_model, callbacks):
             print('Setting most recent model', file=sys.stderr)
     return my_model
 
-def save_model(data_module, model_module, graph_module, 
+def save_model(data_module, model_module, graph_module,
+                data_hparams, model_hparams, graph_hparams,
                 model, trainer, args):
     """
     Save the model and associated artifacts.
@@ -68,6 +70,9 @@ def save_model(data_module, model_module, graph_module,
         data_module (Module): Data module class.
         model_module (Module): Model module class.
         graph_module (Module): Graph module class.
+        data_hparams (Namespace): Processed data module arguments.
+        model_hparams (Namespace): Processed model module arguments.
+        graph_hparams (Namespace): Processed graph module arguments.
         model (nn.Module): The model to be saved.
         trainer (lightning.pytorch.Trainer): The Trainer instance used for training.
         args (dict): Dictionary of input arguments.
@@ -78,28 +83,48 @@ def save_model(data_module, model_module, graph_module,
     local_dir = args['pl.Trainer'].default_root_dir
     save_dict = {
         'data_module'  : data_module.__name__,
-        'data_hparams' : data_module.process_args(args),
+        'data_hparams' : data_hparams,
         'model_module' : model_module.__name__,
-        'model_hparams': model_module.process_args(args),
+        'model_hparams': model_hparams,
         'graph_module' : graph_module.__name__,
-        'graph_hparams': graph_module.process_args(args),
+        'graph_hparams': graph_hparams,
         'model_state_dict': model.state_dict(),
         'timestamp'    : time.strftime("%Y%m%d_%H%M%S"),
-        'random_tag'   : random.randint(100000,999999)
+        'random_tag'   : uuid.uuid4().hex[:6]
     }
-    torch.save(save_dict, os.path.join(local_dir,'torch_checkpoint.pt'))
-    
+    #protocol 5 serializes tensor storages as out-of-band buffers (zero-copy);
+    #serializing to memory means the checkpoint bytes only hit disk inside the
+    #tar instead of being written to local_dir and read back
+    ckpt_buffer = io.BytesIO()
+    torch.save(save_dict, ckpt_buffer,
+               pickle_protocol=5, _use_new_zipfile_serialization=True)
+
+    def add_artifacts(tar):
+        ckpt_info = tarfile.TarInfo('artifacts/torch_checkpoint.pt')
+        ckpt_info.size = ckpt_buffer.tell()
+        ckpt_info.mtime = time.time()
+        ckpt_buffer.seek(0)
+        tar.addfile(ckpt_info, ckpt_buffer)
+        #keep any stale on-disk checkpoint out of the archive
+        tar.add(local_dir, arcname='artifacts',
+                filter=lambda ti: None if ti.name.endswith('torch_checkpoint.pt') else ti)
+
     filename=f'model_artifacts__{save_dict["timestamp"]}__{save_dict["random_tag"]}.tar.gz'
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        with tarfile.open(os.path.join(tmpdirname,filename), 'w:gz') as tar:
-            tar.add(local_dir,arcname='artifacts')
-
-        if 'gs://' in args['Main args'].artifact_path:
-            clound_target = os.path.join(args['Main args'].artifact_path,filename)
-            subprocess.check_call(
-                ['gsutil', 'cp', os.path.join(tmpdirname,filename), clound_target]
-            )
-        else:
+    #level 1: checkpoints are mostly incompressible float data, so higher
+    #levels burn CPU for almost no size reduction
+    if 'gs://' in args['Main args'].artifact_path:
+        #stream the tarball straight into gsutil so it never hits local disk
+        clound_target = os.path.join(args['Main args'].artifact_path,filename)
+        proc = subprocess.Popen(['gsutil', 'cp', '-', clound_target], stdin=subprocess.PIPE)
+        with tarfile.open(fileobj=proc.stdin, mode='w|gz', compresslevel=1) as tar:
+            add_artifacts(tar)
+        proc.stdin.close()
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, 'gsutil cp')
+    else:
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            with tarfile.open(os.path.join(tmpdirname,filename), 'w:gz', compresslevel=1) as tar:
+                add_artifacts(tar)
             os.makedirs(args['Main args'].artifact_path, exist_ok=True)
             shutil.copy(os.path.join(tmpdirname,filename), args['Main args'].artifact_path)
 
@@ -121,17 +146,27 @@ def main(args):
     Returns:
         None
     """
+    if args['Main args'].cudnn_benchmark:
+        torch.backends.cudnn.benchmark = True
+    torch.set_float32_matmul_precision(args['Main args'].matmul_precision)
+
     data_module = getattr(boda.data, args['Main args'].data_module)
     model_module= getattr(boda.model, args['Main args'].model_module)
     graph_module= getattr(boda.graph, args['Main args'].graph_module)
 
-    data = data_module(**vars(data_module.process_args(args)))
-    model= model_module(**vars(model_module.process_args(args)))
+    #process_args is not guaranteed idempotent, so run each module's once
+    #and reuse the results at save time
+    data_hparams = data_module.process_args(args)
+    model_hparams= model_module.process_args(args)
+    graph_hparams= graph_module.process_args(args)
+
+    data = data_module(**vars(data_hparams))
+    model= model_module(**vars(model_hparams))
 
     model.__class__ = type(
         'BODA_module',
         (model_module,graph_module),
-        vars(graph_module.process_args(args))
+        vars(graph_hparams)
     )
     
     use_callbacks = {
@@ -177,7 +212,8 @@ def main(args):
         print("No hypertune instance found.", file=sys.stderr)
         pass
     
-    save_model(data_module, model_module, graph_module, 
+    save_model(data_module, model_module, graph_module,
+               data_hparams, model_hparams, graph_hparams,
                model, trainer, args)
     
 if __name__ == '__main__':
@@ -191,6 +227,8 @@ if __name__ == '__main__':
     group.add_argument('--checkpoint_monitor', type=str, help='String to monior PTL logs if saving best.')
     group.add_argument('--stopping_mode', type=str, default='min', help='Goal for monitored metric e.g. (max or min).')
     group.add_argument('--stopping_patience', type=int, default=100, help='Number of epochs of non-improvement tolerated before early stopping.')
+    group.add_argument('--cudnn_benchmark', type=utils.str2bool, default=True, help='Let cuDNN autotune conv algorithms; shapes are fixed so the cache hits after iter 1.')
+    group.add_argument('--matmul_precision', type=str, default='high', help='Value for torch.set_float32_matmul_precision, e.g. highest, high (TF32), or medium.')
     group.add_argument('--tolerate_unknown_args', type=utils.str2bool, default=False, help='Skips unknown command line args without exceptions. Useful for HPO, but high risk of silent errors.')
     known_args, leftover_args = parser.parse_known_args()
     